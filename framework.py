@@ -1,76 +1,246 @@
-from collections.abc import ValuesView, ItemsView, KeysView, Iterator
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import copy
+import dataclasses
+import email.utils
+from hashlib import blake2b
 import inspect
 import json
 import os
-from typing import Any, Callable, Dict, Optional, TypeVar, List
+import time
+from functools import lru_cache
+from weakref import WeakKeyDictionary
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, NamedTuple, Optional, TypeVar, List, get_type_hints
 
-from openai import OpenAI
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib
+    orjson = None
 
 
 T = TypeVar('T', bound=Callable)
+R = TypeVar('R')
 
 class ToolNotFoundError(Exception):
     """Exception raised when a tool is not found in the registry."""
     pass
 
 
-class ToolRegistry:
-    _instance: Optional['ToolRegistry'] = None
-    _tools: Dict[str, Callable[..., Any]] = {}
-
-    def __new__(cls) -> 'ToolRegistry':
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
+class ToolRegistry(dict[str, Callable[..., Any]]):
+    """Plain dict of tool name -> function. Lookups use the native dict methods;
+    only mutations are overridden, to bump a version counter so that callers
+    can tell when cached views (e.g. of get_tools()) are stale."""
+    version: int = 0
 
-    def __getitem__(self, key: str) -> Callable[..., Any]:
-        return self._tools[key]
+    def _touch(self) -> None:
+        self.version += 1
 
     def __setitem__(self, key: str, value: Callable[..., Any]) -> None:
-        self._tools[key] = value
+        super().__setitem__(key, value)
+        self._touch()
 
     def __delitem__(self, key: str) -> None:
-        del self._tools[key]
+        super().__delitem__(key)
+        self._touch()
 
-    def __iter__(self) -> Iterator[str]:
-        return iter(self._tools)
+    def pop(self, *args: Any) -> Any:
+        result = super().pop(*args)
+        self._touch()
+        return result
 
-    def values(self) -> ValuesView[Callable[..., Any]]:
-        return self._tools.values()
+    def popitem(self) -> Any:
+        result = super().popitem()
+        self._touch()
+        return result
 
-    def items(self) -> ItemsView[str, Callable[..., Any]]:
-        return self._tools.items()
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
 
-    def keys(self) -> KeysView[str]:
-        return self._tools.keys()
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        super().update(*args, **kwargs)
+        self._touch()
 
-    def get(self, key: str, default: Optional[Callable[..., Any]] = None) -> Optional[Callable[..., Any]]:
-        return self._tools.get(key, default)
+    def __ior__(self, other: Any) -> 'ToolRegistry':
+        self.update(other)
+        return self
 
-    def __contains__(self, key: str) -> bool:
-        return key in self._tools
+    def clear(self) -> None:
+        super().clear()
+        self._touch()
 
 
 TOOL_REGISTRY: ToolRegistry = ToolRegistry()
 WEB_TOOL_REGISTRY: ToolRegistry = ToolRegistry()
 
+_META_CACHE: "WeakKeyDictionary[Callable[..., Any], dict]" = WeakKeyDictionary()
+_TOOLS_CACHE: Optional[list[dict]] = None
+_TOOLS_CACHE_VERSION: int = -1
+
+if orjson is not None:
+    def _json_loads(data: Any) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # e.g. NaN, 1e400 or lone surrogate escapes, which the stdlib accepts
+            return json.loads(data)
+
+    def _json_dumps(obj: Any) -> str:
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            # e.g. non-str dict keys or oversized ints, which the stdlib accepts
+            return json.dumps(obj)
+else:
+    _json_loads = json.loads
+    _json_dumps = json.dumps
+
+
+class _ToolRecord(NamedTuple):
+    """Everything precomputed for calling one registered tool."""
+    fn: Callable[..., Any]  # the function in TOOL_REGISTRY this record was built for
+    dispatch: Callable[[str], Any]  # takes the raw JSON arguments string
+    encoder: Callable[[Any], str]  # encodes results, specialized on the return type
+    is_async: bool
+
+
+# Tool name -> precomputed record. TOOL_REGISTRY stays the source of truth: a record
+# is only used while its fn is still the registered function (see _tool_record).
+_TOOL_RECORDS: Dict[str, _ToolRecord] = {}
+
+
+def _encode_int(result: Any) -> str:
+    return str(result) if type(result) is int else _json_dumps(result)
+
+
+def _encode_bool(result: Any) -> str:
+    if type(result) is bool:
+        return "true" if result else "false"
+    return _json_dumps(result)
+
+
+def _encode_dataclass(result: Any) -> str:
+    if not dataclasses.is_dataclass(result) or isinstance(result, type):
+        return _json_dumps(result)
+    if orjson is not None:
+        try:
+            return orjson.dumps(result).decode()  # orjson serializes dataclasses natively
+        except TypeError:
+            pass  # e.g. a field orjson rejects; the stdlib needs a plain dict instead
+    return json.dumps(dataclasses.asdict(result))
+
+
+def _make_encoder(fn: Callable[..., Any], sig: inspect.Signature) -> Callable[[Any], str]:
+    """Pick a result encoder from fn's return annotation. Annotations aren't enforced,
+    so each specialized encoder falls back to the generic one for other types."""
+    returns = sig.return_annotation
+    if isinstance(returns, str):  # postponed annotations
+        try:
+            returns = get_type_hints(fn).get("return", inspect.Signature.empty)
+        except Exception:
+            return _json_dumps
+    if returns is int:
+        return _encode_int
+    if returns is bool:
+        return _encode_bool
+    if isinstance(returns, type) and dataclasses.is_dataclass(returns):
+        return _encode_dataclass
+    return _json_dumps
+
+
+def _make_dispatcher(fn: Callable[..., Any], sig: inspect.Signature) -> Callable[[str], Any]:
+    """Build a closure that parses a JSON arguments string and calls fn with it.
+    Tools taking a single positional-or-keyword parameter skip the ** unpack
+    when the arguments contain exactly that key."""
+    params = tuple(sig.parameters.values())
+    if len(params) == 1 and params[0].kind is inspect.Parameter.POSITIONAL_OR_KEYWORD:
+        only = params[0].name
+
+        def _dispatch_one(arg_json: str, _loads=_json_loads, _fn=fn, _only=only) -> Any:
+            kw = _loads(arg_json)
+            if len(kw) == 1 and _only in kw:
+                return _fn(kw[_only])
+            return _fn(**kw)
+        return _dispatch_one
+
+    def _dispatch(arg_json: str, _loads=_json_loads, _fn=fn) -> Any:
+        return _fn(**_loads(arg_json))
+    return _dispatch
+
+
+def _jit(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Compile fn with numba.njit if Numba is installed, otherwise return it unchanged."""
+    try:
+        import numba
+    except ImportError:
+        return fn
+    return numba.njit(cache=True)(fn)
+
+
+def _build_record(fn: Callable[..., Any], sig: inspect.Signature,
+                  cache: bool | int = False, jit: bool = False) -> _ToolRecord:
+    # Only the dispatcher uses the compiled function; registries keep the original
+    dispatch = _make_dispatcher(_jit(fn) if jit else fn, sig)
+    if cache:
+        # Keyed on the raw arguments string, so cache hits skip JSON parsing too
+        dispatch = lru_cache(maxsize=1024 if cache is True else cache)(dispatch)
+    return _ToolRecord(fn, dispatch, _make_encoder(fn, sig), inspect.iscoroutinefunction(fn))
+
 
-def register_tool(name: str) -> Callable[[T], T]:
-    """Decorator to register a function as a tool."""
+def _tool_record(name: str) -> _ToolRecord:
+    """Return the record for the tool currently registered under name. Tools added
+    to TOOL_REGISTRY directly, or replaced there, get a default record on first use."""
+    fn = TOOL_REGISTRY.get(name)
+    if fn is None:
+        raise ToolNotFoundError(f"Unknown tool: {name}")
+    record = _TOOL_RECORDS.get(name)
+    if record is None or record.fn is not fn:
+        record = _TOOL_RECORDS[name] = _build_record(fn, inspect.signature(fn))
+    return record
+
+
+def _register(name: str, fn: Callable[..., Any], *registries: ToolRegistry,
+              cache: bool | int = False, jit: bool = False) -> None:
+    """Reflect on fn once, precomputing its metadata and dispatcher, then add it
+    to the given registries."""
+    sig = inspect.signature(fn)
+    is_async = inspect.iscoroutinefunction(fn)
+    if cache and is_async:
+        raise ValueError(f"Tool {name!r} is a coroutine function and cannot be cached")
+    if jit and is_async:
+        raise ValueError(f"Tool {name!r} is a coroutine function and cannot be JIT-compiled")
+    _META_CACHE[fn] = _build_tool_metadata(fn, sig)
+    _TOOL_RECORDS[name] = _build_record(fn, sig, cache=cache, jit=jit)
+    for registry in registries:
+        registry[name] = fn
+
+
+def register_tool(name: str, cache: bool | int = False, jit: bool = False) -> Callable[[T], T]:
+    """Decorator to register a function as a tool.
+    Pass cache=True (or a maximum size) to memoize results of pure tools by their
+    arguments. Cached results are shared between calls, so should not be mutated.
+    Pass jit=True to compile numeric tools with Numba when calls are dispatched by
+    run_tool; without Numba installed the function runs as plain Python.
+    """
     def wrapper(fn: T) -> T:
-        TOOL_REGISTRY[name] = fn
+        _register(name, fn, TOOL_REGISTRY, cache=cache, jit=jit)
         return fn
     return wrapper
 
 
-def register_webtool(name: str) -> Callable[[T], T]:
+def register_webtool(name: str, cache: bool | int = False) -> Callable[[T], T]:
     """Decorator to register a function as both an AI tool and a web-exposed tool.
     Functions decorated with this will appear in WEB_TOOL_REGISTRY (for REST API
     adapters) and also in TOOL_REGISTRY (for use with the AI assistant).
+    The cache argument behaves as for register_tool, and applies to AI tool calls only.
     """
     def wrapper(fn: T) -> T:
-        TOOL_REGISTRY[name] = fn
-        WEB_TOOL_REGISTRY[name] = fn
+        _register(name, fn, TOOL_REGISTRY, WEB_TOOL_REGISTRY, cache=cache)
         return fn
     return wrapper
 
@@ -79,8 +249,23 @@ def generate_tool_metadata(tool_fn: Callable[..., Any]) -> dict:
     """
     Generate a tool function description dictionary from a function object.
     The dictionary will have keys: name, description, parameters (type, properties, required, additionalProperties).
+    Results are cached per function object (registered tools are precomputed at
+    registration time); each call returns a fresh copy that is safe to modify.
     """
-    sig = inspect.signature(tool_fn)
+    return copy.deepcopy(_tool_metadata(tool_fn))
+
+
+def _tool_metadata(tool_fn: Callable[..., Any]) -> dict:
+    """Cached metadata for tool_fn, shared between callers; must not be mutated."""
+    cached = _META_CACHE.get(tool_fn)
+    if cached is not None:
+        return cached
+    result = _build_tool_metadata(tool_fn, inspect.signature(tool_fn))
+    _META_CACHE[tool_fn] = result
+    return result
+
+
+def _build_tool_metadata(tool_fn: Callable[..., Any], sig: inspect.Signature) -> dict:
     name = tool_fn.__name__
     description = inspect.getdoc(tool_fn) or f"Tool function: {name}"
     properties: dict[str, dict[str, str]] = {}
@@ -104,100 +289,483 @@ def generate_tool_metadata(tool_fn: Callable[..., Any]) -> dict:
 
 
 def run_tool(tool_call: dict) -> Any:
-    name: str = tool_call["name"]
-    args: dict = json.loads(tool_call["arguments"])
-    tool_fn = TOOL_REGISTRY.get(name)
-    if not tool_fn:
-        raise ToolNotFoundError(f"Unknown tool: {name}")
-    result = tool_fn(**args)
-    return result
+    return _tool_record(tool_call["name"]).dispatch(tool_call["arguments"])
+
+
+async def run_tool_async(tool_call: dict) -> Any:
+    """Async counterpart to run_tool. Coroutine tools are awaited directly;
+    plain functions run in a worker thread so they don't block the event loop."""
+    record = _tool_record(tool_call["name"])
+    if record.is_async:
+        return await record.dispatch(tool_call["arguments"])
+    return await asyncio.to_thread(record.dispatch, tool_call["arguments"])
 
 
 def get_tools() -> list[dict]:
-    return [
-        {"type": "function", "function": generate_tool_metadata(fn)}
-        for fn in TOOL_REGISTRY.values()
-    ]
+    """Return OpenAI tool definitions for every registered tool.
+    Each call returns a fresh copy that is safe to modify.
+    """
+    return copy.deepcopy(_shared_tools())
+
+
+def _shared_tools() -> list[dict]:
+    """Cached tool definitions, shared by every Chatter; must not be mutated.
+    The list is rebuilt only when TOOL_REGISTRY has changed since the last call.
+    """
+    global _TOOLS_CACHE, _TOOLS_CACHE_VERSION
+    if _TOOLS_CACHE is None or _TOOLS_CACHE_VERSION != TOOL_REGISTRY.version:
+        _TOOLS_CACHE = [
+            {"type": "function", "function": _tool_metadata(fn)}
+            for fn in TOOL_REGISTRY.values()
+        ]
+        _TOOLS_CACHE_VERSION = TOOL_REGISTRY.version
+    return _TOOLS_CACHE
+
+
+def _assistant_message(msg: dict) -> dict:
+    m = {"role": "assistant", "content": msg["content"]}
+    tool_calls = msg.get("tool_calls")
+    if tool_calls:
+        # Already in OpenAI dict form; passed through by reference rather than copied
+        m["tool_calls"] = tool_calls
+    return m
+
+
+_ROLE_CONVERTERS: Dict[str, Callable[[dict], dict]] = {
+    "system": lambda msg: {"role": "system", "content": msg["content"]},
+    "user": lambda msg: {"role": "user", "content": msg["content"]},
+    "assistant": _assistant_message,
+    "tool": lambda msg: {
+        "role": "tool",
+        "tool_call_id": msg["tool_call_id"],
+        "name": msg["name"],
+        "content": msg["content"]
+    },
+}
+
+
+def to_openai_message(msg: dict) -> dict:
+    """Convert a history entry into the message shape expected by the OpenAI API."""
+    converter = _ROLE_CONVERTERS.get(msg.get("role"))
+    if converter is None:
+        raise ValueError(f"Invalid role in message: {msg}")
+    return converter(msg)
+
+
+def _merge_tool_call_delta(partial_calls: Dict[int, dict], tc_delta: Any) -> None:
+    """Fold one streamed tool call fragment into the OpenAI-shaped dict for its index."""
+    call = partial_calls.get(tc_delta.index)
+    if call is None:
+        call = partial_calls[tc_delta.index] = {
+            "id": None, "type": "function", "function": {"name": "", "arguments": ""}
+        }
+    if tc_delta.id:
+        call["id"] = tc_delta.id
+    fn = tc_delta.function
+    if fn is not None:
+        if fn.name:
+            call["function"]["name"] += fn.name
+        if fn.arguments:
+            call["function"]["arguments"] += fn.arguments
+
+
+class ResponseCache:
+    """In-memory LRU cache of completed model responses, keyed by response_cache_key().
+
+    Any object with the same get(key)/set(key, value) methods can be passed to
+    Chatter as response_cache instead, e.g. to back the cache with disk or Redis.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: dict) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+def response_cache_key(model: str, tools: list, messages: list) -> str:
+    """Stable hash of everything that determines a completion request."""
+    if orjson is not None:
+        payload = orjson.dumps((model, tools, messages), option=orjson.OPT_SORT_KEYS)
+    else:
+        payload = json.dumps((model, tools, messages), sort_keys=True).encode()
+    return blake2b(payload, digest_size=32).hexdigest()
+
+
+# Server-requested retry delays longer than this are not waited for (as in the OpenAI SDK)
+MAX_RETRY_AFTER = 120.0
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds to wait before retrying, from the Retry-After(-ms) headers of a failed
+    API response, or None if the server didn't say."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    for header, divisor in (("retry-after-ms", 1000), ("retry-after", 1)):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return float(value) / divisor
+        except ValueError:
+            continue
+    try:
+        retry_date = email.utils.parsedate_tz(headers.get("retry-after"))
+        if retry_date is None:
+            return None
+        return float(email.utils.mktime_tz(retry_date) - time.time())
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _should_retry(exc: BaseException) -> bool:
+    """The OpenAI SDK's own retry policy: connection errors and timeouts, and 408, 409,
+    429 and 5xx responses, unless the server says otherwise via x-should-retry or asks
+    for a longer wait than MAX_RETRY_AFTER."""
+    if isinstance(exc, APIConnectionError):  # includes APITimeoutError
+        return True
+    if not isinstance(exc, APIStatusError):
+        return False
+    retry_after = _retry_after(exc)
+    if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+        return False
+    should_retry = exc.response.headers.get("x-should-retry")
+    if should_retry in ("true", "false"):
+        return should_retry == "true"
+    return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+
+
+class ChatScheduler:
+    """Paces requests to the model API so that many concurrent Chatters stay under a
+    requests-per-minute limit, caps how many are in flight, and retries failed requests
+    with exponential backoff, or after the delay the server asks for via Retry-After.
+
+    Share one scheduler between Chatters, within one event loop, to apply a single
+    limit to all of them:
+        scheduler = ChatScheduler(qpm=500)
+        chatters = [Chatter(scheduler=scheduler) for _ in range(100)]
+
+    By default the errors the OpenAI SDK would retry are retried; pass retry_on to
+    retry only the given exception types instead. So that retries are paced too,
+    Chatter turns off the client's own retries (max_retries=0) for the completion
+    requests it sends through the scheduler; its other requests keep them.
+    """
+
+    def __init__(self, qpm: int = 500, max_concurrency: Optional[int] = None,
+                 max_retries: int = 5, base_delay: float = 1.0,
+                 retry_on: Optional[tuple[type[BaseException], ...]] = None):
+        self.interval = 60.0 / qpm
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.retry_on = retry_on
+        self._semaphore = asyncio.Semaphore(max_concurrency or max(1, qpm // 60 * 2))
+        self._next_slot = 0.0
+
+    async def _acquire(self) -> None:
+        """Wait for the next free slot; slots are spaced evenly at the qpm rate."""
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _call(self, make_request: Callable[[], Awaitable[R]]) -> R:
+        attempt = 0
+        while True:
+            await self._acquire()
+            try:
+                return await make_request()
+            except Exception as exc:
+                if attempt >= self.max_retries or not self._is_retryable(exc):
+                    raise
+                delay = _retry_after(exc)
+            if delay is None or not 0 < delay <= MAX_RETRY_AFTER:
+                delay = self.base_delay * 2 ** attempt
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _is_retryable(self, exc: BaseException) -> bool:
+        if self.retry_on is None:
+            return _should_retry(exc)
+        return isinstance(exc, self.retry_on)
+
+    async def schedule(self, make_request: Callable[[], Awaitable[R]]) -> R:
+        """Run make_request() once a slot is free. It is a factory rather than a
+        coroutine so that it can be called again on retry. The concurrency slot is
+        held through any retries, and released once make_request() returns."""
+        async with self._semaphore:
+            return await self._call(make_request)
+
+    @asynccontextmanager
+    async def hold(self, make_request: Callable[[], Awaitable[R]]) -> AsyncIterator[R]:
+        """Like schedule(), but keeps the concurrency slot until the block exits,
+        e.g. while a streamed response is being read."""
+        async with self._semaphore:
+            yield await self._call(make_request)
+
+
+@asynccontextmanager
+async def _unscheduled(make_request: Callable[[], Awaitable[R]]) -> AsyncIterator[R]:
+    yield await make_request()
 
 
 class Chatter:
     """Chatter class encapsulates the chat logic, including message formatting,
     tool call handling, and interaction with the OpenAI client."""
 
-    def __init__(self, system_message=None, tools=None, client=None, model=None):
+    def __init__(self, system_message=None, tools=None, client=None, model=None, response_cache=None,
+                 scheduler=None):
         self.system_message = system_message or "You are a helpful assistant."
-        self.tools = tools if tools is not None else get_tools()
-        self.client = client or OpenAI()
+        # Defaults to the shared cached list; assign a new list rather than mutating it
+        self.tools = tools if tools is not None else _shared_tools()
+        self.client = client or AsyncOpenAI()
         self.model = model or os.getenv("OPENAI_MODEL", "gpt-5-nano")
-
-    def _handle_tool_calls(self, message) -> list:
+        # Optional ResponseCache (or compatible); identical requests are then answered from it
+        self.response_cache = response_cache
+        # Optional ChatScheduler, usually shared between Chatters, to rate limit API requests
+        self.scheduler = scheduler
+        # Completion requests sent through the scheduler are retried by it, so the client's
+        # own retries (which would bypass its pacing) are off for those requests only
+        self._completions_client = self.client
+        if scheduler is not None and hasattr(self.client, "with_options"):
+            self._completions_client = self.client.with_options(max_retries=0)
+
+    @property
+    def _system_msg(self) -> dict:
+        # Built on each use so later changes to system_message take effect
+        return {"role": "system", "content": self.system_message}
+
+    async def _handle_tool_calls(self, tool_calls: list[dict]) -> list:
         """
-        Runs all tool calls in the message and returns OpenAI-compatible tool response dicts.
-        May raise ToolNotFoundError if a tool is not found.
+        Runs all tool calls (in OpenAI dict form) concurrently and returns OpenAI-compatible
+        tool response dicts, in the same order as the tool calls.
+        Every call is allowed to finish before the first failure (e.g. ToolNotFoundError)
+        is re-raised, so no tool is left running in the background.
         """
-        responses = []
-        for tool_call in message.tool_calls:
-            result = run_tool({
-                "name": tool_call.function.name,
-                "arguments": tool_call.function.arguments
-            })
-            responses.append({
-                "role": "tool",
-                "tool_call_id": tool_call.id,
-                "name": tool_call.function.name,
-                "content": json.dumps(result),
-            })
-        return responses
+        functions = [tool_call["function"] for tool_call in tool_calls]
+        results = await asyncio.gather(
+            *[run_tool_async(fn) for fn in functions],
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        # Every tool ran, so each has a record
+        records = _TOOL_RECORDS
+        return [
+            {"role": "tool", "tool_call_id": tool_call["id"], "name": fn["name"],
+             "content": records[fn["name"]].encoder(result)}
+            for tool_call, fn, result in zip(tool_calls, functions, results)
+        ]
 
     def chat(self, message: str, history: list) -> str:
-        history.append({"role": "user", "content": message})
-
-        def to_openai_message(msg):
-            if msg["role"] == "system":
-                return {"role": "system", "content": msg["content"]}
-            elif msg["role"] == "user":
-                return {"role": "user", "content": msg["content"]}
-            elif msg["role"] == "assistant":
-                m = {"role": "assistant", "content": msg["content"]}
-                if "tool_calls" in msg and msg["tool_calls"]:
-                    m["tool_calls"] = msg["tool_calls"]
-                return m
-            elif msg["role"] == "tool":
-                return {
-                    "role": "tool",
-                    "tool_call_id": msg["tool_call_id"],
-                    "name": msg["name"],
-                    "content": msg["content"]
-                }
-            else:
-                raise ValueError(f"Invalid role in message: {msg}")
-
-        messages = [{"role": "system", "content": self.system_message}] + [to_openai_message(m) for m in history]
-
-        while True:
-            response = self.client.chat.completions.create(
+        """Synchronous wrapper around achat(). Must not be called from a running event loop."""
+        return asyncio.run(self.achat(message, history))
+
+    def chat_stream(self, message: str, history: list) -> Iterator[str]:
+        """Synchronous wrapper around achat_stream(). Must not be called from a running event loop."""
+        loop = asyncio.new_event_loop()
+        agen = self.achat_stream(message, history)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            loop.run_until_complete(agen.aclose())
+            loop.close()
+
+    async def achat(self, message: str, history: list) -> str:
+        async for _ in self.achat_stream(message, history):
+            pass
+        return history[-1]["content"]
+
+    async def _complete(self, messages: list, response: dict) -> AsyncIterator[str]:
+        """
+        Requests one streamed completion, yielding text fragments as they arrive, and
+        fills response with the final "content" and "tool_calls" (OpenAI dict form).
+        Served from self.response_cache when an identical request has been seen.
+        """
+        key = None
+        if self.response_cache is not None:
+            key = response_cache_key(self.model, self.tools, messages)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                # Copied both ways so conversations never share mutable tool_calls with the cache
+                response.update(copy.deepcopy(cached))
+                if cached["content"]:
+                    yield cached["content"]
+                return
+
+        def request() -> Awaitable[Any]:
+            return self._completions_client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 tools=self.tools,
-                tool_choice="auto"
+                tool_choice="auto",
+                stream=True
             )
-            assistant_message = response.choices[0].message
 
-            tool_calls = getattr(assistant_message, "tool_calls", None)
+        # With a scheduler, the concurrency slot is held until the stream has been read
+        slot = self.scheduler.hold(request) if self.scheduler is not None else _unscheduled(request)
+        content_parts: List[str] = []
+        partial_calls: Dict[int, dict] = {}
+        async with slot as stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    yield delta.content
+                for tc_delta in delta.tool_calls or ():
+                    _merge_tool_call_delta(partial_calls, tc_delta)
+
+        response["content"] = "".join(content_parts)
+        response["tool_calls"] = [partial_calls[i] for i in sorted(partial_calls)]
+        if key is not None:
+            self.response_cache.set(key, copy.deepcopy(response))
+
+    async def achat_stream(self, message: str, history: list) -> AsyncIterator[str]:
+        """
+        Streams the assistant's reply, yielding text fragments as they arrive.
+        Tool calls are assembled from the stream and run once the model has finished
+        issuing them, and the conversation continues until a reply has no tool calls.
+        """
+        # Only caller-supplied history needs converting; it is done once, up front
+        messages = [self._system_msg] + [to_openai_message(m) for m in history]
+        user_msg = {"role": "user", "content": message}
+        history.append(user_msg)
+        messages.append(user_msg)
+
+        while True:
+            response: dict = {}
+            async for text in self._complete(messages, response):
+                yield text
+
+            tool_calls = response["tool_calls"]
             if tool_calls:
-                tool_calls = [tc.to_dict() if hasattr(tc, "to_dict") else dict(tc) for tc in tool_calls]
-                history.append({"role": "assistant", "content": assistant_message.content or "Tool call issued.", "tool_calls": tool_calls})
-                tool_results = self._handle_tool_calls(assistant_message)
+                assistant_msg = {"role": "assistant", "content": response["content"] or "Tool call issued.", "tool_calls": tool_calls}
+                # Entries built here are already in OpenAI shape, so history and messages share them
+                history.append(assistant_msg)
+                messages.append(assistant_msg)
+                tool_results = await self._handle_tool_calls(tool_calls)
                 for tool_msg in tool_results:
-                    content = tool_msg["content"] or "No results found."
-                    history.append({
-                        "role": "tool",
-                        "tool_call_id": tool_msg["tool_call_id"],
-                        "name": tool_msg["name"],
-                        "content": content
-                    })
-                messages = [{"role": "system", "content": self.system_message}] + [to_openai_message(m) for m in history]
+                    tool_msg["content"] = tool_msg["content"] or "No results found."
+                    history.append(tool_msg)
+                    messages.append(tool_msg)
                 continue
-            content = assistant_message.content or "No response."
+            content = response["content"] or "No response."
             history.append({"role": "assistant", "content": content})
-            return content
+            return
+
+
+class BatchChatter(Chatter):
+    """Runs single completions for many independent conversations at once, e.g. for
+    evals or dataset labelling. Tool calls are returned to the caller, not run.
+
+    run_many() goes through the OpenAI Batch API, which is cheaper and has higher
+    throughput but may take up to the completion window to finish. run_many_concurrent()
+    issues ordinary requests in parallel instead, for providers without a batch API.
+    Both return one {"role", "content", "tool_calls"} dict per conversation, in order.
+    """
+
+    BATCH_ENDPOINT = "/v1/chat/completions"
+    TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+    # Terminal statuses whose output file may hold results worth keeping
+    USABLE_STATUSES = ("completed", "expired")
+
+    def __init__(self, *args, poll_interval: float = 30.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.poll_interval = poll_interval
+
+    def _batch_request(self, custom_id: str, messages: list) -> dict:
+        body = {"model": self.model, "messages": [self._system_msg] + messages}
+        if self.tools:
+            body["tools"] = self.tools
+            body["tool_choice"] = "auto"
+        return {"custom_id": custom_id, "method": "POST", "url": self.BATCH_ENDPOINT, "body": body}
+
+    async def submit(self, conversations: list[list[dict]]) -> str:
+        """Upload the conversations as a batch input file, start the batch and return its id."""
+        lines = [
+            _json_dumps(self._batch_request(str(i), [to_openai_message(m) for m in conversation]))
+            for i, conversation in enumerate(conversations)
+        ]
+        batch_file = await self.client.files.create(
+            file=("batch.jsonl", ("\n".join(lines) + "\n").encode()),
+            purpose="batch"
+        )
+        batch = await self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=self.BATCH_ENDPOINT,
+            completion_window="24h"
+        )
+        return batch.id
+
+    async def wait(self, batch_id: str) -> Any:
+        """Poll until the batch finishes, returning it. An expired batch is returned too,
+        since requests finished before expiry still have results. Raises RuntimeError
+        if the batch failed or was cancelled."""
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            if batch.status in self.TERMINAL_STATUSES:
+                break
+            await asyncio.sleep(self.poll_interval)
+        if batch.status not in self.USABLE_STATUSES:
+            raise RuntimeError(f"Batch {batch_id} ended with status {batch.status!r}")
+        return batch
+
+    async def results(self, batch: Any, count: int) -> list[Optional[dict]]:
+        """Download a finished batch's output. Requests that failed or never ran come back as None."""
+        results: list[Optional[dict]] = [None] * count
+        if not batch.output_file_id:
+            return results
+        output = await self.client.files.content(batch.output_file_id)
+        for line in output.text.splitlines():
+            if not line:
+                continue
+            entry = _json_loads(line)
+            response = entry.get("response")
+            if entry.get("error") or not response or response.get("status_code") != 200:
+                continue
+            message = response["body"]["choices"][0]["message"]
+            results[int(entry["custom_id"])] = {
+                "role": "assistant",
+                "content": message.get("content") or "",
+                "tool_calls": message.get("tool_calls") or [],
+            }
+        return results
+
+    async def run_many(self, conversations: list[list[dict]]) -> list[Optional[dict]]:
+        """Submit the conversations as one batch, wait for it and return the replies."""
+        batch_id = await self.submit(conversations)
+        batch = await self.wait(batch_id)
+        return await self.results(batch, len(conversations))
+
+    async def run_many_concurrent(self, conversations: list[list[dict]], max_concurrency: int = 8) -> list[dict]:
+        """Fallback for providers without a batch API: one streamed request per
+        conversation, with at most max_concurrency in flight."""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(conversation: list[dict]) -> dict:
+            messages = [self._system_msg] + [to_openai_message(m) for m in conversation]
+            response: dict = {}
+            async with semaphore:
+                async for _ in self._complete(messages, response):
+                    pass
+            return {"role": "assistant", **response}
+
+        return await asyncio.gather(*[run_one(conversation) for conversation in conversations])
@@ -1,9 +1,14 @@
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from framework import TOOL_REGISTRY, register_tool, run_tool, generate_tool_metadata, get_tools, ToolNotFoundError
+from framework import TOOL_REGISTRY, WEB_TOOL_REGISTRY, register_webtool, register_tool, run_tool, run_tool_async, generate_tool_metadata, get_tools, ToolNotFoundError, Chatter, BatchChatter, ChatScheduler, ResponseCache, to_openai_message
+import asyncio
+import dataclasses
+import framework
+import openai
 import pytest
 import json
+from types import SimpleNamespace
 
 def test_register_and_run_tool():
 	@register_tool('add')
@@ -37,3 +42,665 @@ def test_get_tools():
 	tools = get_tools()
 	assert isinstance(tools, list)
 	assert any(tool["function"]["name"] == "echo" for tool in tools)
+
+def test_run_tool_async():
+	@register_tool('shout')
+	def shout(msg: str) -> str:
+		"""Upper-case the input message."""
+		return msg.upper()
+
+	tool_call = {"name": "shout", "arguments": json.dumps({"msg": "hi"})}
+	assert asyncio.run(run_tool_async(tool_call)) == "HI"
+
+
+class FakeStream:
+	"""Async iterator over canned stream chunks."""
+	def __init__(self, chunks):
+		self.chunks = iter(chunks)
+
+	def __aiter__(self):
+		return self
+
+	async def __anext__(self):
+		try:
+			return next(self.chunks)
+		except StopIteration:
+			raise StopAsyncIteration
+
+
+def delta_chunk(content=None, tool_calls=None):
+	return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+
+def stream_chunks(message):
+	"""Split a canned message into stream chunks, fragmenting content and tool call arguments."""
+	content = message.content or ""
+	half = len(content) // 2
+	chunks = [delta_chunk(content=piece) for piece in (content[:half], content[half:]) if piece]
+	for index, tc in enumerate(message.tool_calls or []):
+		args = tc.function.arguments
+		half = len(args) // 2
+		chunks.append(delta_chunk(tool_calls=[SimpleNamespace(index=index, id=tc.id, type="function",
+			function=SimpleNamespace(name=tc.function.name, arguments=args[:half]))]))
+		chunks.append(delta_chunk(tool_calls=[SimpleNamespace(index=index, id=None, type=None,
+			function=SimpleNamespace(name=None, arguments=args[half:]))]))
+	return chunks
+
+
+class FakeCompletions:
+	"""Async stand-in for client.chat.completions that replays canned messages."""
+	def __init__(self, messages):
+		self.messages = list(messages)
+		self.calls = []
+
+	async def create(self, **kwargs):
+		self.calls.append({**kwargs, "messages": list(kwargs["messages"])})
+		message = self.messages.pop(0)
+		if kwargs.get("stream"):
+			return FakeStream(stream_chunks(message))
+		return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def fake_client(*messages):
+	return SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(messages)))
+
+
+def fake_tool_call(call_id, name, arguments):
+	return SimpleNamespace(
+		id=call_id,
+		type="function",
+		function=SimpleNamespace(name=name, arguments=json.dumps(arguments)),
+	)
+
+
+def test_chatter_runs_tool_calls():
+	@register_tool('add')
+	def add(a: str, b: str) -> str:
+		"""Add two numbers as strings and return the sum as a string."""
+		return str(int(a) + int(b))
+
+	client = fake_client(
+		SimpleNamespace(content=None, tool_calls=[
+			fake_tool_call("call_1", "add", {"a": "1", "b": "2"}),
+			fake_tool_call("call_2", "add", {"a": "3", "b": "4"}),
+		]),
+		SimpleNamespace(content="3 and 7", tool_calls=None),
+	)
+	history = []
+	reply = Chatter(client=client, model="test-model").chat("add some things", history)
+	assert reply == "3 and 7"
+	assert [m["role"] for m in history] == ["user", "assistant", "tool", "tool", "assistant"]
+	assert [m["content"] for m in history if m["role"] == "tool"] == ['"3"', '"7"']
+	second_call = client.chat.completions.calls[1]["messages"]
+	assert second_call[0]["role"] == "system"
+	assert [m["role"] for m in second_call[1:]] == ["user", "assistant", "tool", "tool"]
+
+def test_get_tools_cache_invalidated_on_register():
+	first = framework._shared_tools()
+	assert framework._shared_tools() is first
+
+	@register_tool('noop')
+	def noop() -> str:
+		"""Do nothing."""
+		return ""
+
+	second = framework._shared_tools()
+	assert second is not first
+	assert any(tool["function"]["name"] == "noop" for tool in second)
+	assert framework._tool_metadata(noop) is framework._tool_metadata(noop)
+
+def test_to_openai_message_rejects_unknown_role():
+	with pytest.raises(ValueError):
+		to_openai_message({"role": "narrator", "content": "Meanwhile..."})
+
+def test_web_tool_registry_only_holds_web_tools():
+	@register_webtool('ping')
+	def ping() -> str:
+		"""Reply with pong."""
+		return "pong"
+
+	@register_tool('pong')
+	def pong() -> str:
+		"""Reply with ping."""
+		return "ping"
+
+	assert 'ping' in TOOL_REGISTRY
+	assert 'ping' in WEB_TOOL_REGISTRY
+	assert 'pong' in TOOL_REGISTRY
+	assert 'pong' not in WEB_TOOL_REGISTRY
+
+def test_run_tool_single_arg_dispatch():
+	@register_tool('greet')
+	def greet(name: str) -> str:
+		"""Greet someone by name."""
+		return f"Hello, {name}"
+
+	assert run_tool({"name": "greet", "arguments": json.dumps({"name": "Ada"})}) == "Hello, Ada"
+	with pytest.raises(TypeError):
+		run_tool({"name": "greet", "arguments": json.dumps({"nom": "Ada"})})
+
+def test_json_dumps_falls_back_for_non_str_keys():
+	assert json.loads(framework._json_dumps({1: "one"})) == {"1": "one"}
+
+def test_run_tool_async_awaits_coroutine_tools():
+	@register_tool('async_echo')
+	async def async_echo(msg: str) -> str:
+		"""Echo the input message asynchronously."""
+		await asyncio.sleep(0)
+		return msg
+
+	tool_call = {"name": "async_echo", "arguments": json.dumps({"msg": "hi"})}
+	assert asyncio.run(run_tool_async(tool_call)) == "hi"
+	assert generate_tool_metadata(async_echo)["parameters"]["required"] == ["msg"]
+
+def test_chatter_finishes_sibling_tool_calls_before_raising():
+	finished = []
+
+	@register_tool('slow_note')
+	async def slow_note(msg: str) -> str:
+		"""Record a note after a short delay."""
+		await asyncio.sleep(0.01)
+		finished.append(msg)
+		return msg
+
+	client = fake_client(
+		SimpleNamespace(content=None, tool_calls=[
+			fake_tool_call("call_1", "nonexistent", {}),
+			fake_tool_call("call_2", "slow_note", {"msg": "done"}),
+		]),
+	)
+	with pytest.raises(ToolNotFoundError):
+		Chatter(client=client, model="test-model").chat("go", [])
+	assert finished == ["done"]
+
+def test_register_tool_with_cache():
+	calls = []
+
+	@register_tool('square', cache=True)
+	def square(n: str) -> str:
+		"""Square a number given as a string."""
+		calls.append(n)
+		return str(int(n) ** 2)
+
+	tool_call = {"name": "square", "arguments": json.dumps({"n": "4"})}
+	assert run_tool(tool_call) == "16"
+	assert run_tool(tool_call) == "16"
+	assert calls == ["4"]
+
+	with pytest.raises(ValueError):
+		@register_tool('async_square', cache=True)
+		async def async_square(n: str) -> str:
+			"""Square a number given as a string."""
+			return str(int(n) ** 2)
+
+def test_chatter_chat_stream_yields_text():
+	@register_tool('add')
+	def add(a: str, b: str) -> str:
+		"""Add two numbers as strings and return the sum as a string."""
+		return str(int(a) + int(b))
+
+	client = fake_client(
+		SimpleNamespace(content=None, tool_calls=[fake_tool_call("call_1", "add", {"a": "1", "b": "2"})]),
+		SimpleNamespace(content="The answer is 3", tool_calls=None),
+	)
+	history = []
+	parts = list(Chatter(client=client, model="test-model").chat_stream("add", history))
+	assert len(parts) > 1
+	assert "".join(parts) == "The answer is 3"
+	assert history[1]["tool_calls"] == [{"id": "call_1", "type": "function",
+		"function": {"name": "add", "arguments": json.dumps({"a": "1", "b": "2"})}}]
+	assert history[-1] == {"role": "assistant", "content": "The answer is 3"}
+
+def test_chatter_response_cache_skips_identical_requests():
+	client = fake_client(SimpleNamespace(content="Hello!", tool_calls=None))
+	chatter = Chatter(client=client, model="test-model", tools=[], response_cache=ResponseCache())
+	assert chatter.chat("hi", []) == "Hello!"
+	assert chatter.chat("hi", []) == "Hello!"
+	assert len(client.chat.completions.calls) == 1
+
+
+def test_response_cache_evicts_least_recently_used():
+	cache = ResponseCache(maxsize=2)
+	cache.set("a", {"content": "a"})
+	cache.set("b", {"content": "b"})
+	cache.get("a")
+	cache.set("c", {"content": "c"})
+	assert cache.get("b") is None
+	assert cache.get("a") == {"content": "a"}
+
+def test_register_tool_with_jit_falls_back_without_numba(monkeypatch):
+	monkeypatch.setitem(sys.modules, 'numba', None)
+
+	@register_tool('multiply', jit=True)
+	def multiply(a, b):
+		"""Multiply two numbers."""
+		return a * b
+
+	assert run_tool({"name": "multiply", "arguments": json.dumps({"a": 6, "b": 7})}) == 42
+	assert TOOL_REGISTRY['multiply'] is multiply
+
+
+def test_register_tool_with_jit_uses_numba_njit(monkeypatch):
+	njit_calls = []
+
+	def njit(**options):
+		njit_calls.append(options)
+
+		def compile(fn):
+			def compiled(*args, **kwargs):
+				return ("compiled", fn(*args, **kwargs))
+			return compiled
+		return compile
+
+	monkeypatch.setitem(sys.modules, 'numba', SimpleNamespace(njit=njit))
+
+	@register_tool('subtract', jit=True)
+	def subtract(a, b):
+		"""Subtract b from a."""
+		return a - b
+
+	assert njit_calls == [{"cache": True}]
+	assert run_tool({"name": "subtract", "arguments": json.dumps({"a": 7, "b": 2})}) == ("compiled", 5)
+	assert TOOL_REGISTRY['subtract'] is subtract
+
+
+class FakeBatchClient:
+	"""Async stand-in for the files/batches endpoints used by BatchChatter."""
+	def __init__(self, replies, final_status="completed"):
+		self.replies = replies
+		self.final_status = final_status
+		self.uploaded = None
+		self.polls = 0
+		self.files = SimpleNamespace(create=self.create_file, content=self.file_content)
+		self.batches = SimpleNamespace(create=self.create_batch, retrieve=self.retrieve_batch)
+
+	async def create_file(self, file, purpose):
+		self.uploaded = [json.loads(line) for line in file[1].decode().splitlines()]
+		return SimpleNamespace(id="file-in")
+
+	async def create_batch(self, input_file_id, endpoint, completion_window):
+		return SimpleNamespace(id="batch-1")
+
+	async def retrieve_batch(self, batch_id):
+		self.polls += 1
+		status = self.final_status if self.polls > 1 else "in_progress"
+		return SimpleNamespace(id=batch_id, status=status, output_file_id="file-out")
+
+	async def file_content(self, file_id):
+		# Results are deliberately out of order, and the second request failed
+		lines = [
+			{"custom_id": "2", "response": {"status_code": 200, "body": {"choices": [{"message": {"role": "assistant", "content": self.replies[2]}}]}}, "error": None},
+			{"custom_id": "1", "response": {"status_code": 500, "body": {}}, "error": None},
+			{"custom_id": "0", "response": {"status_code": 200, "body": {"choices": [{"message": {"role": "assistant", "content": self.replies[0]}}]}}, "error": None},
+		]
+		return SimpleNamespace(text="\n".join(json.dumps(line) for line in lines))
+
+
+def test_batch_chatter_run_many():
+	client = FakeBatchClient(["zero", "one", "two"])
+	chatter = BatchChatter(client=client, model="test-model", tools=[], poll_interval=0)
+	conversations = [[{"role": "user", "content": str(i)}] for i in range(3)]
+	results = asyncio.run(chatter.run_many(conversations))
+	assert [line["custom_id"] for line in client.uploaded] == ["0", "1", "2"]
+	assert client.uploaded[1]["body"]["messages"][-1] == {"role": "user", "content": "1"}
+	assert results[0]["content"] == "zero"
+	assert results[1] is None
+	assert results[2]["content"] == "two"
+
+
+def test_batch_chatter_run_many_concurrent():
+	client = fake_client(
+		SimpleNamespace(content="first", tool_calls=None),
+		SimpleNamespace(content="second", tool_calls=None),
+	)
+	chatter = BatchChatter(client=client, model="test-model", tools=[])
+	conversations = [[{"role": "user", "content": "a"}], [{"role": "user", "content": "b"}]]
+	results = asyncio.run(chatter.run_many_concurrent(conversations, max_concurrency=1))
+	assert [r["content"] for r in results] == ["first", "second"]
+
+def test_chatters_share_cached_tools_list():
+	first = Chatter(client=fake_client(), model="test-model")
+	second = Chatter(client=fake_client(), model="test-model")
+	assert first.tools is second.tools
+	assert first.tools is framework._shared_tools()
+
+
+@dataclasses.dataclass
+class Point:
+	x: int
+	y: int
+
+
+def test_tool_result_encoders_follow_return_annotation():
+	@register_tool('count')
+	def count(items: str) -> int:
+		"""Count comma-separated items."""
+		return len(items.split(","))
+
+	@register_tool('origin')
+	def origin() -> Point:
+		"""Return the origin."""
+		return Point(0, 0)
+
+	@register_tool('is_empty')
+	def is_empty(items: str) -> bool:
+		"""Report whether the string is empty."""
+		return not items
+
+	def encoder(name):
+		return framework._tool_record(name).encoder
+
+	assert encoder('count')(3) == "3"
+	assert encoder('count')("not an int") == '"not an int"'
+	assert encoder('is_empty')(False) == "false"
+	assert json.loads(encoder('origin')(Point(0, 0))) == {"x": 0, "y": 0}
+
+
+class Flaky(Exception):
+	pass
+
+
+def test_chat_scheduler_retries_then_succeeds():
+	attempts = []
+
+	async def request():
+		attempts.append(1)
+		if len(attempts) < 3:
+			raise Flaky()
+		return "ok"
+
+	scheduler = ChatScheduler(qpm=60000, base_delay=0, retry_on=(Flaky,))
+	assert asyncio.run(scheduler.schedule(request)) == "ok"
+	assert len(attempts) == 3
+
+
+def test_chat_scheduler_gives_up_after_max_retries():
+	async def request():
+		raise Flaky()
+
+	scheduler = ChatScheduler(qpm=60000, max_retries=2, base_delay=0, retry_on=(Flaky,))
+	with pytest.raises(Flaky):
+		asyncio.run(scheduler.schedule(request))
+
+
+def test_chat_scheduler_paces_requests():
+	async def run():
+		loop = asyncio.get_running_loop()
+		scheduler = ChatScheduler(qpm=1200)  # one request every 50ms
+		times = []
+
+		async def request():
+			times.append(loop.time())
+
+		await asyncio.gather(*[scheduler.schedule(request) for _ in range(3)])
+		return times
+
+	times = asyncio.run(run())
+	assert times[2] - times[0] >= 0.09
+
+
+def test_chatter_retries_through_scheduler():
+	client = fake_client(SimpleNamespace(content="Hello!", tool_calls=None))
+	completions = client.chat.completions
+	create = completions.create
+	failures = [Flaky()]
+
+	async def flaky_create(**kwargs):
+		if failures:
+			raise failures.pop()
+		return await create(**kwargs)
+
+	completions.create = flaky_create
+	scheduler = ChatScheduler(qpm=60000, base_delay=0, retry_on=(Flaky,))
+	assert Chatter(client=client, model="test-model", tools=[], scheduler=scheduler).chat("hi", []) == "Hello!"
+	assert failures == []
+	assert len(completions.calls) == 1
+
+
+def test_scheduler_holds_slot_until_stream_is_read():
+	events = []
+	client = fake_client(
+		SimpleNamespace(content="first reply", tool_calls=None),
+		SimpleNamespace(content="second reply", tool_calls=None),
+	)
+	completions = client.chat.completions
+	create = completions.create
+
+	async def tracked_create(**kwargs):
+		events.append("start")
+		stream = await create(**kwargs)
+
+		async def chunks():
+			async for chunk in stream:
+				await asyncio.sleep(0.01)  # much longer than the 1ms pacing interval
+				yield chunk
+			events.append("end")
+		return chunks()
+
+	completions.create = tracked_create
+	scheduler = ChatScheduler(qpm=60000, max_concurrency=1)
+	chatters = [Chatter(client=client, model="test-model", tools=[], scheduler=scheduler) for _ in range(2)]
+
+	async def run():
+		return await asyncio.gather(*[chatter.achat("hi", []) for chatter in chatters])
+
+	assert asyncio.run(run()) == ["first reply", "second reply"]
+	assert events == ["start", "end", "start", "end"]
+
+def test_chatter_reuses_new_history_entries_as_messages():
+	@register_tool('add')
+	def add(a: str, b: str) -> str:
+		"""Add two numbers as strings and return the sum as a string."""
+		return str(int(a) + int(b))
+
+	client = fake_client(
+		SimpleNamespace(content=None, tool_calls=[fake_tool_call("call_1", "add", {"a": "1", "b": "2"})]),
+		SimpleNamespace(content="3", tool_calls=None),
+	)
+	history = [{"role": "user", "content": "hello"}, {"role": "assistant", "content": "hi"}]
+	Chatter(client=client, model="test-model").chat("add", history)
+	sent = client.chat.completions.calls[1]["messages"]
+	assert sent[1:3] == history[:2]
+	assert all(sent[i] is history[i - 1] for i in range(3, 6))
+
+def test_get_tools_cache_invalidated_by_every_registry_mutation():
+	def extra() -> str:
+		"""An extra tool."""
+		return ""
+
+	mutations = [
+		lambda: TOOL_REGISTRY.setdefault('extra', extra),
+		lambda: TOOL_REGISTRY.popitem(),
+		lambda: TOOL_REGISTRY.__ior__({'extra': extra}),
+		lambda: TOOL_REGISTRY.pop('extra'),
+	]
+	for mutate in mutations:
+		before = framework._shared_tools()
+		mutate()
+		assert framework._shared_tools() is not before
+		assert [t["function"]["name"] for t in get_tools()] == [generate_tool_metadata(fn)["name"] for fn in TOOL_REGISTRY.values()]
+
+
+def test_run_tool_follows_direct_registry_assignment_and_deletion():
+	def hello(name: str) -> str:
+		"""Say hello."""
+		return f"hello {name}"
+
+	TOOL_REGISTRY['hello'] = hello
+	tool_call = {"name": "hello", "arguments": json.dumps({"name": "Ada"})}
+	assert any(tool["function"]["name"] == "hello" for tool in get_tools())
+	assert run_tool(tool_call) == "hello Ada"
+	assert asyncio.run(run_tool_async(tool_call)) == "hello Ada"
+
+	def goodbye(name: str) -> str:
+		"""Say goodbye."""
+		return f"goodbye {name}"
+
+	TOOL_REGISTRY['hello'] = goodbye
+	assert run_tool(tool_call) == "goodbye Ada"
+
+	del TOOL_REGISTRY['hello']
+	assert not any(tool["function"]["name"] == "goodbye" for tool in get_tools())
+	with pytest.raises(ToolNotFoundError):
+		run_tool(tool_call)
+	with pytest.raises(ToolNotFoundError):
+		asyncio.run(run_tool_async(tool_call))
+
+
+def test_register_tool_deleted_from_registry_is_not_run():
+	@register_tool('gone')
+	def gone() -> str:
+		"""Vanish."""
+		return "still here"
+
+	del TOOL_REGISTRY['gone']
+	with pytest.raises(ToolNotFoundError):
+		run_tool({"name": "gone", "arguments": "{}"})
+
+
+def test_chatter_response_cache_does_not_share_tool_calls():
+	@register_tool('add')
+	def add(a: str, b: str) -> str:
+		"""Add two numbers as strings and return the sum as a string."""
+		return str(int(a) + int(b))
+
+	tool_message = SimpleNamespace(content=None, tool_calls=[fake_tool_call("call_1", "add", {"a": "1", "b": "2"})])
+	client = fake_client(tool_message, SimpleNamespace(content="3", tool_calls=None))
+	chatter = Chatter(client=client, model="test-model", response_cache=ResponseCache())
+	first, second = [], []
+	chatter.chat("add", first)
+	chatter.chat("add", second)
+	assert len(client.chat.completions.calls) == 2
+	assert second[1]["tool_calls"] == first[1]["tool_calls"]
+	assert second[1]["tool_calls"] is not first[1]["tool_calls"]
+	first[1]["tool_calls"][0]["function"]["arguments"] = "{}"
+	assert json.loads(second[1]["tool_calls"][0]["function"]["arguments"]) == {"a": "1", "b": "2"}
+
+
+def test_batch_chatter_run_many_keeps_results_of_expired_batch():
+	client = FakeBatchClient(["zero", "one", "two"], final_status="expired")
+	chatter = BatchChatter(client=client, model="test-model", tools=[], poll_interval=0)
+	conversations = [[{"role": "user", "content": str(i)}] for i in range(3)]
+	results = asyncio.run(chatter.run_many(conversations))
+	assert [r and r["content"] for r in results] == ["zero", None, "two"]
+
+
+@pytest.mark.parametrize("status", ["failed", "cancelled"])
+def test_batch_chatter_run_many_raises_for_failed_batch(status):
+	client = FakeBatchClient(["zero"], final_status=status)
+	chatter = BatchChatter(client=client, model="test-model", tools=[], poll_interval=0)
+	with pytest.raises(RuntimeError):
+		asyncio.run(chatter.run_many([[{"role": "user", "content": "0"}]]))
+
+
+@dataclasses.dataclass
+class Labels:
+	names: dict
+
+
+def test_dataclass_encoder_handles_fields_orjson_rejects():
+	@register_tool('labels')
+	def labels() -> Labels:
+		"""Return labels keyed by number."""
+		return Labels({1: "a"})
+
+	encoder = framework._tool_record('labels').encoder
+	assert json.loads(encoder(Labels({1: "a"}))) == {"names": {"1": "a"}}
+	assert json.loads(encoder(Point(1, 2))) == {"x": 1, "y": 2}
+
+
+def test_get_tools_and_metadata_return_copies():
+	@register_tool('lookup')
+	def lookup(query: str) -> str:
+		"""Look something up."""
+		return query
+
+	tools = get_tools()
+	tools.append({"type": "function", "function": {"name": "web_search"}})
+	meta = generate_tool_metadata(lookup)
+	meta["parameters"]["properties"]["query"]["type"] = "integer"
+
+	assert not any(tool["function"]["name"] == "web_search" for tool in get_tools())
+	assert generate_tool_metadata(lookup)["parameters"]["properties"]["query"]["type"] == "string"
+	lookup_tool = next(t for t in Chatter(client=fake_client(), model="test-model").tools if t["function"]["name"] == "lookup")
+	assert lookup_tool["function"]["parameters"]["properties"]["query"]["type"] == "string"
+
+
+def test_chatter_uses_updated_system_message():
+	client = fake_client(SimpleNamespace(content="Arr!", tool_calls=None))
+	chatter = Chatter(client=client, model="test-model", tools=[])
+	chatter.system_message = "You are a pirate."
+	chatter.chat("hi", [])
+	assert client.chat.completions.calls[0]["messages"][0] == {"role": "system", "content": "You are a pirate."}
+
+
+@pytest.mark.parametrize("arguments, expected", [
+	('{"x": NaN}', "nan"),
+	('{"x": 1e400}', "inf"),
+	('{"x": "\\ud800"}', "\ud800"),
+])
+def test_run_tool_accepts_arguments_the_stdlib_accepts(arguments, expected):
+	@register_tool('show')
+	def show(x) -> str:
+		"""Show a value."""
+		return str(x)
+
+	assert run_tool({"name": "show", "arguments": arguments}) == expected
+
+
+def api_error(error_cls, status_code, headers=None):
+	response = SimpleNamespace(status_code=status_code, headers=headers or {}, request=None)
+	return error_cls("boom", response=response, body=None)
+
+
+@pytest.mark.parametrize("error, retried", [
+	(lambda: openai.APIConnectionError(request=None), True),
+	(lambda: openai.APITimeoutError(request=None), True),
+	(lambda: api_error(openai.InternalServerError, 503), True),
+	(lambda: api_error(openai.RateLimitError, 429), True),
+	(lambda: api_error(openai.ConflictError, 409), True),
+	(lambda: api_error(openai.APIStatusError, 408), True),
+	(lambda: api_error(openai.BadRequestError, 400), False),
+	(lambda: api_error(openai.InternalServerError, 500, {"x-should-retry": "false"}), False),
+	(lambda: api_error(openai.BadRequestError, 400, {"x-should-retry": "true"}), True),
+	(lambda: api_error(openai.RateLimitError, 429, {"retry-after": "600"}), False),
+])
+def test_chat_scheduler_default_retry_policy_matches_sdk(error, retried):
+	attempts = []
+
+	async def request():
+		attempts.append(1)
+		if len(attempts) == 1:
+			raise error()
+		return "ok"
+
+	scheduler = ChatScheduler(qpm=60000, base_delay=0)
+	if retried:
+		assert asyncio.run(scheduler.schedule(request)) == "ok"
+		assert len(attempts) == 2
+	else:
+		with pytest.raises(openai.APIError):
+			asyncio.run(scheduler.schedule(request))
+		assert len(attempts) == 1
+
+
+def test_chat_scheduler_honours_retry_after():
+	attempts = []
+
+	async def request():
+		attempts.append(1)
+		if len(attempts) == 1:
+			raise api_error(openai.RateLimitError, 429, {"retry-after-ms": "1"})
+		return "ok"
+
+	# base_delay would wait a minute if Retry-After were ignored
+	scheduler = ChatScheduler(qpm=60000, base_delay=60)
+	assert asyncio.run(asyncio.wait_for(scheduler.schedule(request), timeout=5)) == "ok"
+
+
+def test_chatter_with_scheduler_keeps_client_retries_for_other_requests():
+	client = openai.AsyncOpenAI(api_key="test-key")
+	chatter = Chatter(client=client, model="test-model", tools=[], scheduler=ChatScheduler())
+	assert chatter.client is client
+	assert chatter.client.max_retries == 2
+	assert chatter._completions_client.max_retries == 0